@@ -5,20 +5,23 @@ Author: Ken Lambert
 
 from abstractcollection import AbstractCollection
 from bstnode import BSTNode
-from linkedstack import LinkedStack
+from collections import deque
+from bisect import bisect_left
 from math import log
 import random
 import time
-import sys
+
 
 
 class LinkedBST(AbstractCollection):
-    """An link-based binary search tree implementation."""
+    """An link-based binary search tree implementation, kept
+    height-balanced as an AVL tree."""
 
     def __init__(self, sourceCollection=None):
         """Sets the initial state of self, which includes the
         contents of sourceCollection, if it's present."""
         self._root = None
+        self._heights = {}
         AbstractCollection.__init__(self, sourceCollection)
 
     # Accessor methods
@@ -40,72 +43,61 @@ class LinkedBST(AbstractCollection):
     def __iter__(self):
         """Supports a preorder traversal on a view of self."""
         if not self.isEmpty():
-            stack = LinkedStack()
-            stack.push(self._root)
-            while not stack.isEmpty():
+            stack = [self._root]
+            while stack:
                 node = stack.pop()
                 yield node.data
                 if node.right:
-                    stack.push(node.right)
+                    stack.append(node.right)
                 if node.left:
-                    stack.push(node.left)
+                    stack.append(node.left)
 
     def preorder(self):
         """Supports a preorder traversal on a view of self."""
-        lyst = list()
-
-        def recurse(node):
-            if node:
-                lyst.append(node.data)
-                recurse(node.left)
-                recurse(node.right)
-
-        recurse(self._root)
-        return iter(lyst)
+        return iter(self)
 
     def inorder(self):
         """Supports an inorder traversal on a view of self."""
-        lyst = list()
-
-        def recurse(node):
-            if node:
-                recurse(node.left)
-                lyst.append(node.data)
-                recurse(node.right)
-
-        recurse(self._root)
-        return iter(lyst)
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.data
+            node = node.right
 
     def postorder(self):
         """Supports a postorder traversal on a view of self."""
-        lyst = list()
-
-        def recurse(node):
-            if node:
-                recurse(node.left)
-                recurse(node.right)
-                lyst.append(node.data)
-
-        recurse(self._root)
-        return iter(lyst)
+        stack = []
+        last = None
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            top = stack[-1]
+            # Visit the right subtree first unless it was just finished
+            if top.right is not None and top.right is not last:
+                node = top.right
+            else:
+                last = stack.pop()
+                yield last.data
 
     def levelorder(self):
         """Supports a levelorder traversal on a view of self."""
         lst = []
-
-        def print_level(root, level, lst1):
-            if root is None:
-                return None
-            if level == 1:
-                lst1.append(root.data)
-            elif level > 1:
-                print_level(root.left, level - 1, lst)
-                print_level(root.right, level - 1, lst)
-
-        root = self._root
-        height1 = self.height()
-        for i in range(height1):
-            print_level(root, i + 1, lst)
+        if self._root is None:
+            return lst
+        queue = deque([self._root])
+        while queue:
+            node = queue.popleft()
+            lst.append(node.data)
+            if node.left:
+                queue.append(node.left)
+            if node.right:
+                queue.append(node.right)
         return lst
 
     def __contains__(self, item):
@@ -115,103 +107,78 @@ class LinkedBST(AbstractCollection):
     def find(self, item):
         """If item matches an item in self, returns the
         matched item, or None otherwise."""
-
-        def recurse(node):
-            if node is None:
-                return None
-            elif item == node.data:
-                return node.data
-            elif item < node.data:
-                return recurse(node.left)
+        node = self._root
+        while node is not None:
+            data = node.data
+            if item is data or item == data:
+                return data
+            elif item < data:
+                node = node.left
             else:
-                return recurse(node.right)
-
-        return recurse(self._root)
+                node = node.right
+        return None
 
     # Mutator methods
     def clear(self):
         """Makes self become empty."""
         self._root = None
+        self._heights = {}
         self._size = 0
 
     def add(self, item):
-        """Adds item to the tree."""
-
-        # Helper function to search for item's position
-        def recurse(node):
-            # New item is less, go left until spot is found
-            if item < node.data:
-                if node.left is None:
-                    node.left = BSTNode(item)
-                else:
-                    recurse(node.left)
-            # New item is greater or equal,
-            # go right until spot is found
-            elif node.right is None:
-                node.right = BSTNode(item)
-            else:
-                recurse(node.right)
-                # End of recurse
+        """Adds item to the tree and restores its AVL balance."""
 
+        new_node = BSTNode(item)
+        self._heights[new_node] = 1
         # Tree is empty, so new item goes at the root
         if self.isEmpty():
-            self._root = BSTNode(item)
-        # Otherwise, search for the item's spot
+            self._root = new_node
+        # Otherwise, walk down to the item's spot
         else:
-            recurse(self._root)
+            path = []
+            node = self._root
+            while True:
+                path.append(node)
+                # New item is less, go left until spot is found
+                if item < node.data:
+                    if node.left is None:
+                        node.left = new_node
+                        break
+                    node = node.left
+                # New item is greater or equal,
+                # go right until spot is found
+                else:
+                    if node.right is None:
+                        node.right = new_node
+                        break
+                    node = node.right
+            self._retrace(path)
         self._size += 1
 
     def remove(self, item):
         """Precondition: item is in self.
         Raises: KeyError if item is not in self.
         postcondition: item is removed from self."""
-        if item not in self:
-            raise KeyError("Item not in tree." "")
-
-        # Helper function to adjust placement of an item
-        def lift_max_in_left_subtree_to_top(top):
-            # Replace top's datum with the maximum datum in the left subtree
-            # Pre:  top has a left child
-            # Post: the maximum node in top's left subtree
-            #       has been removed
-            # Post: top.data = maximum value in top's left subtree
-            parent = top
-            current_node = top.left
-            while current_node.right is not None:
-                parent = current_node
-                current_node = current_node.right
-            top.data = current_node.data
-            if parent == top:
-                top.left = current_node.left
-            else:
-                parent.right = current_node.left
-
-        # Begin main part of the method
-        if self.isEmpty():
-            return None
 
-        # Attempt to locate the node containing the item
+        # Attempt to locate the node containing the item,
+        # remembering the path of its ancestors
         item_removed = None
-        pre_root = BSTNode(None)
-        pre_root.left = self._root
-        parent = pre_root
-        direction = "L"
+        path = []
         current_node = self._root
         while current_node is not None:
-            if current_node.data == item:
-                item_removed = current_node.data
+            data = current_node.data
+            if item is data or item == data:
+                item_removed = data
                 break
-            parent = current_node
-            if current_node.data > item:
-                direction = "L"
+            path.append(current_node)
+            if item < data:
                 current_node = current_node.left
             else:
-                direction = "R"
                 current_node = current_node.right
 
-        # Return None if the item is absent
-        if item_removed is None:
-            return None
+        # Raise KeyError if the item is absent
+        if current_node is None:
+            raise KeyError("Item not in tree.")
 
         # The item is present, so remove its node
 
@@ -220,7 +187,19 @@ class LinkedBST(AbstractCollection):
         #         left subtree
         #         Delete the maximium node in the left subtree
         if current_node.left and current_node.right:
-            lift_max_in_left_subtree_to_top(current_node)
+            top = current_node
+            path.append(top)
+            parent = top
+            current_node = top.left
+            while current_node.right is not None:
+                parent = current_node
+                path.append(parent)
+                current_node = current_node.right
+            top.data = current_node.data
+            if parent is top:
+                top.left = current_node.left
+            else:
+                parent.right = current_node.left
         else:
 
             # Case 2: The node has no left child
@@ -232,19 +211,21 @@ class LinkedBST(AbstractCollection):
                 new_child = current_node.left
 
                 # Case 2 & 3: Tie the parent to the new child
-            if direction == "L":
-                parent.left = new_child
+            if not path:
+                self._root = new_child
+            elif path[-1].left is current_node:
+                path[-1].left = new_child
             else:
-                parent.right = new_child
+                path[-1].right = new_child
 
-        # All cases: Reset the root (if it hasn't changed no harm done)
+        # All cases: Forget the unlinked node and rebalance its ancestors
         #            Decrement the collection's size counter
         #            Return the item
+        del self._heights[current_node]
+        self._retrace(path)
         self._size -= 1
         if self.isEmpty():
             self._root = None
-        else:
-            self._root = pre_root.left
         return item_removed
 
     def replace(self, item, new_item):
@@ -263,37 +244,89 @@ class LinkedBST(AbstractCollection):
                 probe = probe.right
         return None
 
+    # AVL helpers
+    def _update_height(self, node):
+        """Recomputes the AVL height of node from its children."""
+        heights = self._heights
+        heights[node] = 1 + max(heights.get(node.left, 0), heights.get(node.right, 0))
+
+    def _rotate_left(self, node):
+        """Rotates the subtree rooted at node to the left and
+        returns its new root."""
+        pivot = node.right
+        node.right = pivot.left
+        pivot.left = node
+        self._update_height(node)
+        self._update_height(pivot)
+        return pivot
+
+    def _rotate_right(self, node):
+        """Rotates the subtree rooted at node to the right and
+        returns its new root."""
+        pivot = node.left
+        node.left = pivot.right
+        pivot.right = node
+        self._update_height(node)
+        self._update_height(pivot)
+        return pivot
+
+    def _balance_node(self, node):
+        """Restores the AVL property at node and returns the root
+        of the resulting subtree."""
+        heights = self._heights
+        self._update_height(node)
+        balance = heights.get(node.left, 0) - heights.get(node.right, 0)
+        if balance > 1:
+            # Left-right case needs an extra rotation of the left child
+            child = node.left
+            if heights.get(child.left, 0) < heights.get(child.right, 0):
+                node.left = self._rotate_left(child)
+            return self._rotate_right(node)
+        if balance < -1:
+            # Right-left case needs an extra rotation of the right child
+            child = node.right
+            if heights.get(child.right, 0) < heights.get(child.left, 0):
+                node.right = self._rotate_right(child)
+            return self._rotate_left(node)
+        return node
+
+    def _retrace(self, path):
+        """Rebalances the nodes on path, a list of nodes from the root
+        downwards, starting at its bottom."""
+        heights = self._heights
+        for pos in range(len(path) - 1, -1, -1):
+            node = path[pos]
+            old_height = heights[node]
+            top = self._balance_node(node)
+            if top is node:
+                # Nothing changed below the ancestors, so they stay intact
+                if heights[node] == old_height:
+                    break
+                continue
+            if pos == 0:
+                self._root = top
+            elif path[pos - 1].left is node:
+                path[pos - 1].left = top
+            else:
+                path[pos - 1].right = top
+
     def height(self):
         """
         Return the height of tree
         :return: int
         """
 
-        def height1(pos):
-            """Return the height of the subtree rooted at Position p."""
-            if pos is None or not pos.left and not pos.right:
-                return 0
-            else:
-                return 1 + max(height1(child) for child in [pos.left, pos.right])
-
-        return height1(self._root)
+        if self._root is None:
+            return 0
+        # The AVL height table counts a leaf as 1, this method as 0
+        return self._heights[self._root] - 1
 
     def is_balanced(self):
         """
         Return True if tree is balanced
         :return:
         """
-
-        def helper():
-            """Helper for count of vertices of the tree"""
-            cnt = 0
-            itr = self.inorder()
-            for _ in itr:
-                cnt += 1
-            return cnt
-
-        number = helper()
-        if self.height() < 2 * log(2 * (number + 1)) - 1:
+        if self.height() < 2 * log(2 * (self._size + 1)) - 1:
             return True
         return False
 
@@ -305,9 +338,18 @@ class LinkedBST(AbstractCollection):
         :return:
         '''
         ans = []
-        for number in list(self.inorder()):
-            if low <= number <= high:
-                ans.append(number)
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            # Go left only while smaller items may still be in range
+            while node is not None:
+                stack.append(node)
+                node = node.left if node.data >= low else None
+            node = stack.pop()
+            if low <= node.data <= high:
+                ans.append(node.data)
+            # Go right only while larger items may still be in range
+            node = node.right if node.data <= high else None
         if len(ans) > 0:
             return ans
         return None
@@ -317,18 +359,60 @@ class LinkedBST(AbstractCollection):
         Rebalances the tree.
         :return:
         """
-        elems = self.inorder()
-
-        def rb1(elems):
-            if len(elems) == 0:
-                return None
-            mid = len(elems) // 2
+        # Fill a preallocated list with the items in order
+        elems = [None] * self._size
+        pos = 0
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            elems[pos] = node.data
+            pos += 1
+            node = node.right
+        self._build_balanced(elems)
+
+    @classmethod
+    def from_sorted(cls, sourceCollection):
+        """
+        Returns a balanced tree holding the items of sourceCollection,
+        which must already be in ascending order.
+        :param sourceCollection:
+        :return: LinkedBST
+        """
+        tree = cls()
+        elems = list(sourceCollection)
+        tree._build_balanced(elems)
+        tree._size = len(elems)
+        return tree
+
+    def _build_balanced(self, elems):
+        """Replaces the nodes of self with a balanced tree built
+        from the sorted list elems."""
+        heights = {}
+
+        # Build each subtree from the slice elems[low:high] by index,
+        # hanging it under parent on the side given by direction
+        pre_root = BSTNode(None)
+        stack = [(0, len(elems), pre_root, "L")]
+        while stack:
+            low, high, parent, direction = stack.pop()
+            if low >= high:
+                continue
+            mid = (low + high) // 2
             node = BSTNode(elems[mid])
-            node.left = rb1(elems[:mid])
-            node.right = rb1(elems[mid + 1 :])
-            return node
+            heights[node] = (high - low).bit_length()
+            if direction == "L":
+                parent.left = node
+            else:
+                parent.right = node
+            stack.append((low, mid, node, "L"))
+            stack.append((mid + 1, high, node, "R"))
 
-        self._root = rb1(list(elems))
+        self._root = pre_root.left
+        self._heights = heights
 
     def successor(self, item):
         """
@@ -339,21 +423,15 @@ class LinkedBST(AbstractCollection):
         :return:
         :rtype:
         """
-        min_num = 10**32
-        if not self.isEmpty():
-            stack = LinkedStack()
-            stack.push(self._root)
-            while not stack.isEmpty():
-                node1 = stack.pop()
-                if item < node1.data <= min_num:
-                    min_num = node1.data
-                if node1.right:
-                    stack.push(node1.right)
-                if node1.left:
-                    stack.push(node1.left)
-        if min_num != 10**32:
-            return min_num
-        return None
+        best = None
+        node = self._root
+        while node is not None:
+            if node.data > item:
+                best = node.data
+                node = node.left
+            else:
+                node = node.right
+        return best
 
     def predecessor(self, item):
         """
@@ -364,21 +442,15 @@ class LinkedBST(AbstractCollection):
         :return:
         :rtype:
         """
-        max_num = -(10**32)
-        if not self.isEmpty():
-            stack = LinkedStack()
-            stack.push(self._root)
-            while not stack.isEmpty():
-                node1 = stack.pop()
-                if max_num <= node1.data < item:
-                    max_num = node1.data
-                if node1.left:
-                    stack.push(node1.left)
-                if node1.right:
-                    stack.push(node1.right)
-        if max_num != -(10**32):
-            return max_num
-        return None
+        best = None
+        node = self._root
+        while node is not None:
+            if node.data < item:
+                best = node.data
+                node = node.right
+            else:
+                node = node.left
+        return best
 
     def demo_bst(self, path):
         """
@@ -395,20 +467,17 @@ class LinkedBST(AbstractCollection):
 
         random_words = random.sample(lines, 10000)
         # Number 1: sorted list
+        sorted_lines = sorted(lines)
         start = time.time()
         for word in random_words:
-            for pos in range(len(lines)):
-                if lines[pos] == word:
-                    break
+            pos = bisect_left(sorted_lines, word)
+            found = pos < len(sorted_lines) and sorted_lines[pos] == word
         end = time.time()
         delta = end - start
         print(f"Result 1: {delta}")
 
-        # Number 2: tree (recursion limit error)
-        sys.setrecursionlimit(1000000)
-        tree = LinkedBST()
-        for pos in range(len(lines)):
-            tree.add(lines[pos])
+        # Number 2: tree built from the sorted list
+        tree = LinkedBST.from_sorted(sorted_lines)
         start = time.time()
         for word in random_words:
             tree.find(word)
@@ -429,14 +498,15 @@ class LinkedBST(AbstractCollection):
         print(f"Result 3: {delta}")
 
         # Number 4: balanced tree
-        tree.rebalance()
+        tree1.rebalance()
         start = time.time()
         for word in random_words:
-            tree.find(word)
+            tree1.find(word)
         end = time.time()
         delta = end - start
         print(f"Result 4: {delta}")
 
 
-tree = LinkedBST([5, 4, 6, 3, 8, 19])
-tree.demo_bst("words.txt")
+if __name__ == "__main__":
+    tree = LinkedBST([5, 4, 6, 3, 8, 19])
+    tree.demo_bst("words.txt")